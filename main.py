@@ -1,12 +1,25 @@
+import copy
 import logging
-import json
 import os
+import re
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.error import RetryAfter
+from telegram.ext import AIORateLimiter, Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
 import yt_dlp
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import shutil
 import tempfile
+from urllib.parse import urlparse
+from uuid import uuid4
+import orjson
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -23,46 +36,85 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if id.strip()]
 REQUIRED_CHANNEL = os.getenv('REQUIRED_CHANNEL', '')
+MAX_PARALLEL_DOWNLOADS = int(os.getenv('MAX_PARALLEL_DOWNLOADS', '4'))
+MAX_PARALLEL_PREFETCHES = int(os.getenv('MAX_PARALLEL_PREFETCHES', '2'))
+# Webhook settings; the bot falls back to polling when WEBHOOK_URL is unset
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', urlparse(WEBHOOK_URL).path.lstrip('/'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
 
 # Configuration file
 CONFIG_FILE = "bot_config.json"
 
+# Shared working directory for downloads; each file is removed after upload.
+# Without WORK_DIR the bot uses a private directory that is removed on shutdown.
+WORK_DIR = os.getenv('WORK_DIR', '')
+
 # Validate required configuration
 if not BOT_TOKEN or not ADMIN_IDS:
     raise ValueError("Missing required environment variables: BOT_TOKEN and ADMIN_IDS")
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    raise ValueError("WEBHOOK_SECRET is required when WEBHOOK_URL is set")
 
 # Default configuration
 DEFAULT_CONFIG = {
     "required_channel": REQUIRED_CHANNEL
 }
 
+# Cached configuration, refreshed only when the file changes on disk
+_config_cache = None
+_config_mtime = None
+
 # Load or create configuration
 def load_config():
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                config = json.load(f)
-                # Ensure all keys are present
-                for key, value in DEFAULT_CONFIG.items():
-                    if key not in config:
-                        config[key] = value
-                return config
-        except Exception as e:
-            logger.error(f"Error loading config: {e}")
-            return DEFAULT_CONFIG
-    else:
+    global _config_cache, _config_mtime
+    try:
+        mtime = os.stat(CONFIG_FILE).st_mtime
+        if _config_cache is not None and mtime == _config_mtime:
+            return _config_cache
+        config = orjson.loads(Path(CONFIG_FILE).read_bytes())
+    except FileNotFoundError:
         save_config(DEFAULT_CONFIG)
         return DEFAULT_CONFIG
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.error(f"Error loading config: {e}")
+        return DEFAULT_CONFIG
+    if not isinstance(config, dict):
+        logger.error(f"Error loading config: expected a JSON object, got {type(config).__name__}")
+        return DEFAULT_CONFIG
+    
+    # Ensure all keys are present
+    for key, value in DEFAULT_CONFIG.items():
+        if key not in config:
+            config[key] = value
+    _config_cache = config
+    _config_mtime = mtime
+    return config
 
 def save_config(config):
+    global _config_cache, _config_mtime
     try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2)
+        # Write to a temp file and swap it in so a crash never leaves a partial config
+        tmp_file = f"{CONFIG_FILE}.tmp"
+        Path(tmp_file).write_bytes(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_file, CONFIG_FILE)
+        _config_cache = config
+        _config_mtime = os.stat(CONFIG_FILE).st_mtime
     except Exception as e:
         logger.error(f"Error saving config: {e}")
 
-# User sessions to track download progress
-user_sessions = {}
+# User sessions to track download progress; abandoned sessions expire after 10 minutes
+user_sessions = TTLCache(maxsize=10_000, ttl=600)
+
+# Recent confirmed channel memberships keyed by (channel, user id),
+# to avoid a get_chat_member call per check
+MEMBER_CACHE = TTLCache(maxsize=50_000, ttl=300)
+
+# Pre-extracted video metadata keyed by URL, so a format choice skips re-extraction
+INFO_CACHE = TTLCache(maxsize=200, ttl=300)
+
+# Caption URL tables are large and unused by downloads, so they're not cached
+INFO_CACHE_DROP_KEYS = ('automatic_captions', 'subtitles')
 
 # Supported formats
 FORMATS = {
@@ -73,86 +125,206 @@ FORMATS = {
     'mp3': 'MP3 Audio'
 }
 
+# Format selection keyboard and /formats text, built once
+FORMAT_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(value, callback_data=f"format_{key}")] for key, value in FORMATS.items()]
+)
+FORMATS_TEXT = "*Available Formats:*\n\n" + "".join(
+    f"• {value} (`{key}`)\n" for key, value in FORMATS.items()
+)
+
+# YouTube URL validator, compiled once
+YT_URL_RE = re.compile(r'^https?://(?:www\.|m\.|music\.)?(?:youtube\.com|youtu\.be)/')
+
+# Every possible 20-block progress bar, indexed by the number of filled blocks
+PROGRESS_BARS = tuple('█' * i + '░' * (20 - i) for i in range(21))
+PROGRESS_TEMPLATE = "📥 Downloading: [{}] {:.1f}%\n⚡ Speed: {}\n⏱ ETA: {}"
+# Used when yt-dlp can't tell the total size, so no bar can be drawn
+PROGRESS_UNKNOWN_TEMPLATE = "📥 Downloading...\n📦 Downloaded: {}\n⚡ Speed: {}"
+
+def format_size(size):
+    """Format a byte count as a short human-readable string."""
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+def format_speed(speed):
+    """Format a speed in bytes/s as a short human-readable string."""
+    if not speed:
+        return 'N/A'
+    return f"{format_size(speed)}/s"
+
+def format_eta(eta):
+    """Format an ETA in seconds as MM:SS or HH:MM:SS."""
+    if eta is None:
+        return 'N/A'
+    minutes, seconds = divmod(int(eta), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+def _extract_info(url):
+    """Extract video metadata without downloading or selecting a format."""
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'noplaylist': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False, process=False)
+
+def _do_download(ydl_opts, url, info=None):
+    """Run a blocking yt-dlp download; meant to be called from an executor thread."""
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if info is not None:
+            # Reuse pre-extracted metadata; yt-dlp mutates it, so work on a copy
+            info_dict = ydl.process_ie_result(copy.deepcopy(info), download=True)
+        else:
+            info_dict = ydl.extract_info(url, download=True)
+        # Playlist URLs download only their first entry; name and title the file after it
+        if info_dict.get('_type') == 'playlist':
+            entries = info_dict.get('entries') or []
+            if not entries:
+                raise ValueError("The playlist has no videos to download.")
+            info_dict = entries[0]
+        return info_dict, ydl.prepare_filename(info_dict)
+
+def _remove_download_files(work_dir, file_prefix):
+    """Delete every file in the work directory belonging to one download."""
+    for path in work_dir.glob(f"{file_prefix}*"):
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+
 class ProgressHook:
     def __init__(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         self.update = update
         self.context = context
         self.user_id = user_id
+        # yt-dlp calls the hook from its worker thread, so Telegram calls are
+        # submitted back to the event loop that created the hook
+        self.loop = asyncio.get_running_loop()
         self.last_update = 0
         self.message_id = None
         self.last_progress_text = ""
+        self._last_pct_int = -1
+        self._inflight = False
+        # Future of the most recent progress update, so the finish edit can wait for it
+        self._pending = None
 
-    async def __call__(self, d):
+    def __call__(self, d):
         if d['status'] == 'downloading':
             # Update progress every 2 seconds to avoid spamming
-            import time
-            current_time = time.time()
+            current_time = time.monotonic()
             if current_time - self.last_update < 2:
                 return
-            self.last_update = current_time
+            # Drop this tick if the previous edit hasn't completed yet
+            if self._inflight:
+                return
             
-            # Get progress information
-            percent = d.get('_percent_str', '0%')
-            speed = d.get('_speed_str', 'N/A')
-            eta = d.get('_eta_str', 'N/A')
+            # Get progress information from the raw numeric fields
+            downloaded = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            speed = format_speed(d.get('speed'))
             
-            # Create progress bar
-            try:
-                percent_float = float(percent.replace('%', ''))
-                filled_blocks = int(percent_float // 5)  # 20 blocks for 100%
-                progress_bar = '█' * filled_blocks + '░' * (20 - filled_blocks)
-                progress_text = f"📥 Downloading: [{progress_bar}] {percent}\n⚡ Speed: {speed}\n⏱ ETA: {eta}"
-            except:
-                progress_text = f"📥 Downloading...\n📊 Progress: {percent}\n⚡ Speed: {speed}\n⏱ ETA: {eta}"
+            if total:
+                percent = min(100 * downloaded / total, 100.0)
+                
+                # Only rebuild the message when the whole percentage changes
+                if int(percent) == self._last_pct_int:
+                    return
+                self._last_pct_int = int(percent)
+                
+                # Create progress bar
+                filled_blocks = int(percent // 5)  # 20 blocks for 100%
+                progress_text = PROGRESS_TEMPLATE.format(
+                    PROGRESS_BARS[filled_blocks],
+                    percent,
+                    speed,
+                    format_eta(d.get('eta'))
+                )
+            else:
+                # Unknown total size; throttled by time only
+                progress_text = PROGRESS_UNKNOWN_TEMPLATE.format(format_size(downloaded), speed)
+            self.last_update = current_time
             
             # Only update if the text has changed
             if progress_text != self.last_progress_text:
                 self.last_progress_text = progress_text
-                # Update message
-                try:
-                    if self.message_id is None:
-                        # Send initial progress message
-                        message = await self.context.bot.send_message(
-                            chat_id=self.user_id,
-                            text=progress_text
-                        )
-                        self.message_id = message.message_id
-                    else:
-                        # Edit existing message
-                        await self.context.bot.edit_message_text(
-                            chat_id=self.user_id,
-                            message_id=self.message_id,
-                            text=progress_text
-                        )
-                except Exception as e:
-                    logger.warning(f"Could not update progress message: {e}")
+                self._inflight = True
+                self._pending = asyncio.run_coroutine_threadsafe(
+                    self._update_message(progress_text), self.loop
+                )
                 
         elif d['status'] == 'finished':
             # Update message to show processing
-            try:
-                if self.message_id:
-                    await self.context.bot.edit_message_text(
-                        chat_id=self.user_id,
-                        message_id=self.message_id,
-                        text="✅ Download complete! Processing file..."
-                    )
-            except Exception as e:
-                logger.warning(f"Could not update progress message: {e}")
+            asyncio.run_coroutine_threadsafe(self._finish_message(self._pending), self.loop)
+
+    async def _update_message(self, progress_text):
+        """Send or edit the progress message; runs on the event loop."""
+        try:
+            if self.message_id is None:
+                # Send initial progress message
+                message = await self.context.bot.send_message(
+                    chat_id=self.user_id,
+                    text=progress_text
+                )
+                self.message_id = message.message_id
+            else:
+                # Edit existing message
+                await self.context.bot.edit_message_text(
+                    chat_id=self.user_id,
+                    message_id=self.message_id,
+                    text=progress_text
+                )
+        except RetryAfter as e:
+            # Back off until Telegram lifts the flood limit
+            self.last_update = time.monotonic() + e.retry_after
+        except Exception as e:
+            logger.warning(f"Could not update progress message: {e}")
+        finally:
+            self._inflight = False
+
+    async def _finish_message(self, pending):
+        """Show that the download finished; runs on the event loop."""
+        try:
+            # Let an in-flight first send_message set message_id before editing
+            if pending is not None:
+                await asyncio.wrap_future(pending)
+            if self.message_id:
+                await self.context.bot.edit_message_text(
+                    chat_id=self.user_id,
+                    message_id=self.message_id,
+                    text="✅ Download complete! Processing file..."
+                )
+        except Exception as e:
+            logger.warning(f"Could not update progress message: {e}")
 
 class YouTubeDownloaderBot:
     def __init__(self, token):
         self.token = token
         self.application = None
-        
-    def get_required_channel(self):
-        """Get the current required channel from config file"""
-        config = load_config()
-        return config.get('required_channel', REQUIRED_CHANNEL)
+        self.work_dir = None
+        # Keep the required channel in memory; only /setchannel changes it
+        self.required_channel = load_config().get('required_channel', REQUIRED_CHANNEL)
+        # Limit how many downloads run at once; the rest wait their turn
+        self.download_sem = asyncio.Semaphore(MAX_PARALLEL_DOWNLOADS)
+        self.queued_downloads = 0
+        # Metadata prefetches get their own small pool so they can't crowd out downloads
+        self.prefetch_executor = ThreadPoolExecutor(
+            max_workers=MAX_PARALLEL_PREFETCHES, thread_name_prefix='prefetch'
+        )
+        # In-flight prefetch tasks keyed by URL, so a download can wait for one
+        self.prefetching = {}
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Send a message when the command /start is issued."""
         user = update.effective_user
-        required_channel = self.get_required_channel()
+        required_channel = self.required_channel
         
         # Create the welcome message with proper Markdown escaping
         welcome_message = (
@@ -211,19 +383,23 @@ class YouTubeDownloaderBot:
 
     async def formats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show available formats."""
-        formats_text = "*Available Formats:*\n\n"
-        for key, value in FORMATS.items():
-            formats_text += f"• {value} (`{key}`)\n"
-        await update.message.reply_text(formats_text, parse_mode='Markdown')
+        await update.message.reply_text(FORMATS_TEXT, parse_mode='Markdown')
 
     async def check_membership(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Check if user is a member of the required channel."""
         user_id = update.effective_user.id
-        required_channel = self.get_required_channel()
+        required_channel = self.required_channel
         
         try:
-            member = await context.bot.get_chat_member(required_channel, user_id)
-            if member.status in ['member', 'administrator', 'creator']:
+            # Only positive results are cached so users who just joined are re-checked
+            cache_key = (required_channel, user_id)
+            is_member = cache_key in MEMBER_CACHE
+            if not is_member:
+                member = await context.bot.get_chat_member(required_channel, user_id)
+                is_member = member.status in ['member', 'administrator', 'creator']
+                if is_member:
+                    MEMBER_CACHE[cache_key] = True
+            if is_member:
                 await update.message.reply_text(f"✅ You are a member of {required_channel}!")
                 return True
             else:
@@ -256,7 +432,9 @@ class YouTubeDownloaderBot:
             return
         
         # Update configuration
-        config = load_config()
+        self.required_channel = channel
+        MEMBER_CACHE.clear()
+        config = dict(load_config())
         config['required_channel'] = channel
         save_config(config)
         
@@ -269,7 +447,7 @@ class YouTubeDownloaderBot:
             await update.message.reply_text("❌ You don't have permission to use this command.")
             return
         
-        required_channel = self.get_required_channel()
+        required_channel = self.required_channel
         await update.message.reply_text(f"Current required channel: {required_channel}")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -277,24 +455,41 @@ class YouTubeDownloaderBot:
         text = update.message.text.strip()
         
         # Check if it's a valid YouTube URL
-        if not ("youtube.com" in text or "youtu.be" in text):
+        if not YT_URL_RE.match(text):
             await update.message.reply_text("Please send a valid YouTube URL.")
             return
             
         user_id = update.effective_user.id
         user_sessions[user_id] = {'url': text}
         
-        # Create format selection buttons
-        keyboard = []
-        for key, value in FORMATS.items():
-            keyboard.append([InlineKeyboardButton(value, callback_data=f"format_{key}")])
+        # Fetch metadata while the user picks a format
+        # Skip when cached, already being fetched, or all prefetch workers are busy
+        if (text not in INFO_CACHE and text not in self.prefetching
+                and len(self.prefetching) < MAX_PARALLEL_PREFETCHES):
+            self.prefetching[text] = asyncio.create_task(self.prefetch_info(text))
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
             "Select download format:",
-            reply_markup=reply_markup
+            reply_markup=FORMAT_KEYBOARD
         )
 
+    async def prefetch_info(self, url):
+        """Extract video metadata in the background, cache it and return it (or None)."""
+        try:
+            loop = asyncio.get_running_loop()
+            info = await loop.run_in_executor(self.prefetch_executor, _extract_info, url)
+            # Playlist results hold lazy entries that can't be reused; only cache single videos
+            if info.get('_type', 'video') == 'video':
+                for key in INFO_CACHE_DROP_KEYS:
+                    info.pop(key, None)
+                INFO_CACHE[url] = info
+                return info
+        except Exception as e:
+            logger.warning(f"Could not prefetch video info: {e}")
+        finally:
+            self.prefetching.pop(url, None)
+        return None
+
     async def format_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle format selection buttons."""
         query = update.callback_query
@@ -303,12 +498,13 @@ class YouTubeDownloaderBot:
         user_id = query.from_user.id
         format_key = query.data.split('_')[1]
         
-        if user_id not in user_sessions:
+        session = user_sessions.get(user_id)
+        if session is None:
             await query.edit_message_text("Session expired. Please send the URL again.")
             return
             
-        url = user_sessions[user_id]['url']
-        user_sessions[user_id]['format'] = format_key
+        url = session['url']
+        session['format'] = format_key
         
         # Acknowledge format selection
         format_name = FORMATS.get(format_key, format_key)
@@ -320,63 +516,114 @@ class YouTubeDownloaderBot:
     async def process_download(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id, url, format_key):
         """Handle the download process with proper error handling."""
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Initialize progress tracking
-                progress_hook = ProgressHook(update, context, user_id)
+            # Let the user know if they have to wait for a free slot
+            queued = self.download_sem.locked()
+            if queued:
+                self.queued_downloads += 1
+            try:
+                if queued:
+                    try:
+                        await context.bot.send_message(
+                            chat_id=user_id,
+                            text=f"⏳ Queued, position {self.queued_downloads}. Your download will start shortly."
+                        )
+                    except Exception as e:
+                        logger.warning(f"Could not send queue message: {e}")
+                await self.download_sem.acquire()
+            finally:
+                # Leave the queue even if waiting was cancelled or failed
+                if queued:
+                    self.queued_downloads -= 1
+            
+            try:
+                # Unique prefix so concurrent downloads never share files
+                file_prefix = f"{user_id}_{uuid4().hex}_"
+                try:
+                    # Initialize progress tracking
+                    progress_hook = ProgressHook(update, context, user_id)
                 
-                # Configure download options
-                ydl_opts = {
-                    'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-                    'noplaylist': True,
-                    'progress_hooks': [progress_hook],
-                    'quiet': True,
-                    'no_warnings': True,
-                }
+                    # Configure download options
+                    ydl_opts = {
+                        'outtmpl': str(self.work_dir / f'{file_prefix}%(title)s.%(ext)s'),
+                        'noplaylist': True,
+                        # For playlist URLs only resolve the first entry
+                        'playlist_items': '1',
+                        'lazy_playlist': True,
+                        'progress_hooks': [progress_hook],
+                        'quiet': True,
+                        'no_warnings': True,
+                        # Fetch segmented (HLS/DASH) formats in parallel
+                        'concurrent_fragment_downloads': 4,
+                        'socket_timeout': 30,
+                        'retries': 5,
+                        'fragment_retries': 5,
+                    }
                 
-                # Handle format-specific options
-                if format_key == 'mp3':
-                    ydl_opts.update({
-                        'format': 'bestaudio/best',
-                        'postprocessors': [{
-                            'key': 'FFmpegExtractAudio',
-                            'preferredcodec': 'mp3',
-                            'preferredquality': '192',
-                        }],
-                    })
-                else:
-                    ydl_opts['format'] = format_key
+                    # Handle format-specific options
+                    if format_key == 'mp3':
+                        ydl_opts.update({
+                            'format': 'bestaudio/best',
+                            'postprocessors': [{
+                                'key': 'FFmpegExtractAudio',
+                                'preferredcodec': 'mp3',
+                                'preferredquality': '192',
+                            }],
+                        })
+                    else:
+                        ydl_opts['format'] = format_key
                 
-                # Download the video
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info_dict = ydl.extract_info(url, download=True)
-                    filename = ydl.prepare_filename(info_dict)
+                    # Reuse prefetched metadata, waiting for a prefetch that is still running
+                    info = INFO_CACHE.get(url)
+                    prefetch = self.prefetching.get(url)
+                    if info is None and prefetch is not None:
+                        info = await asyncio.shield(prefetch)
+                    
+                    # Download the video off the event loop
+                    loop = asyncio.get_running_loop()
+                    info_dict, filename = await loop.run_in_executor(
+                        None, _do_download, ydl_opts, url, info
+                    )
                 
-                # Handle MP3 conversion if needed
-                if format_key == 'mp3':
-                    mp3_filename = filename.rsplit('.', 1)[0] + '.mp3'
-                    if os.path.exists(mp3_filename):
-                        filename = mp3_filename
+                    # Handle MP3 conversion if needed
+                    if format_key == 'mp3':
+                        mp3_filename = filename.rsplit('.', 1)[0] + '.mp3'
+                        if os.path.exists(mp3_filename):
+                            filename = mp3_filename
                 
-                # Send the appropriate file type
-                title = info_dict.get('title', 'video')
-                if filename.endswith('.mp3'):
-                    await context.bot.send_audio(
-                        chat_id=user_id,
-                        audio=open(filename, 'rb'),
-                        title=title
-                    )
-                elif any(filename.endswith(ext) for ext in ['.mp4', '.webm', '.mkv']):
-                    await context.bot.send_video(
-                        chat_id=user_id,
-                        video=open(filename, 'rb'),
-                        caption=title
-                    )
-                else:
-                    await context.bot.send_document(
-                        chat_id=user_id,
-                        document=open(filename, 'rb'),
-                        caption=title
+                    # Read the file off the event loop; this also avoids leaking open handles
+                    file_data = await loop.run_in_executor(None, Path(filename).read_bytes)
+                    file_name = os.path.basename(filename)[len(file_prefix):]
+                    
+                    # Send the appropriate file type
+                    title = info_dict.get('title', 'video')
+                    if filename.endswith('.mp3'):
+                        await context.bot.send_audio(
+                            chat_id=user_id,
+                            audio=file_data,
+                            filename=file_name,
+                            title=title
+                        )
+                    elif any(filename.endswith(ext) for ext in ['.mp4', '.webm', '.mkv']):
+                        await context.bot.send_video(
+                            chat_id=user_id,
+                            video=file_data,
+                            filename=file_name,
+                            caption=title
+                        )
+                    else:
+                        await context.bot.send_document(
+                            chat_id=user_id,
+                            document=file_data,
+                            filename=file_name,
+                            caption=title
+                        )
+                finally:
+                    # Remove the download and any partial or intermediate files
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, _remove_download_files, self.work_dir, file_prefix
                     )
+            finally:
+                self.download_sem.release()
                 
         except yt_dlp.DownloadError as e:
             error_msg = "Download failed. The video may be restricted or unavailable."
@@ -386,8 +633,7 @@ class YouTubeDownloaderBot:
             logger.error(f"Unexpected error: {str(e)}")
         else:
             # Clean up session on success
-            if user_id in user_sessions:
-                del user_sessions[user_id]
+            user_sessions.pop(user_id, None)
             return
         
         # Handle errors
@@ -400,13 +646,41 @@ class YouTubeDownloaderBot:
             logger.error(f"Failed to send error message: {str(e)}")
         
         # Clean up session on error
-        if user_id in user_sessions:
-            del user_sessions[user_id]
+        user_sessions.pop(user_id, None)
+
+    async def remove_work_dir(self, application: Application):
+        """Remove the private download directory on shutdown."""
+        if not WORK_DIR and self.work_dir is not None:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
 
     def run(self):
         """Start the bot."""
+        # Use uvloop for the event loop where available
+        if uvloop is not None:
+            uvloop.install()
+        
+        # Set up the download directory
+        if WORK_DIR:
+            self.work_dir = Path(WORK_DIR)
+            self.work_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        else:
+            self.work_dir = Path(tempfile.mkdtemp(prefix='ytdl-'))
+        
         # Create the Application
-        self.application = Application.builder().token(self.token).build()
+        self.application = (
+            Application.builder()
+            .token(self.token)
+            # Size the HTTP pool for many concurrent handlers; uploads need a long write timeout
+            .connection_pool_size(256)
+            .pool_timeout(30.0)
+            .connect_timeout(20.0)
+            .read_timeout(60.0)
+            .write_timeout(300.0)
+            .get_updates_connection_pool_size(1)
+            .rate_limiter(AIORateLimiter(max_retries=3))
+            .post_shutdown(self.remove_work_dir)
+            .build()
+        )
 
         # Register handlers
         handlers = [
@@ -425,7 +699,16 @@ class YouTubeDownloaderBot:
 
         # Run the bot
         logger.info("Starting bot...")
-        self.application.run_polling()
+        if WEBHOOK_URL:
+            self.application.run_webhook(
+                listen='0.0.0.0',
+                port=int(os.getenv('PORT', '8443')),
+                url_path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                webhook_url=WEBHOOK_URL
+            )
+        else:
+            self.application.run_polling()
 
 if __name__ == '__main__':
     bot = YouTubeDownloaderBot(BOT_TOKEN)